@@ -0,0 +1,499 @@
+"""Выгрузка задач из GitHub Projects (ProjectsV2) через GraphQL API."""
+import asyncio
+import time
+import logging
+import sqlite3
+import httpx
+import orjson
+import pandas as pd
+from datetime import datetime
+from itertools import chain
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# --- Настройки проекта ---
+ORG = "Maxinum"
+PAGE_SIZE = 100
+GRAPHQL_URL = "https://api.github.com/graphql"
+MAX_CONCURRENCY = 20  # одновременных запросов к GitHub
+MAX_RETRIES = 5
+TIMEOUT = 10  # секунд на запрос
+# страницы задач (батч из нескольких проектов, search) с вложенными assignees/fieldValues
+# GitHub собирает заметно дольше списка проектов — ответ ждём дольше
+ITEMS_TIMEOUT = httpx.Timeout(TIMEOUT, read=60)
+CACHE_PATH = ".gh_cache.sqlite"  # кэш страниц задач между запусками (только с use_cache=True)
+# секунд; правки самих задач (assignees, title, repo) не меняют updatedAt проекта,
+# поэтому дольше этого срока страница не живёт даже при неизменном проекте
+CACHE_TTL = 3600
+ACTUAL_NAMES   = {"actual","actual hours","acutal hours"}
+ESTIMATE_NAMES = {"estimate","planned hours","hours","estimate hours","estimates"}
+FIELD_KIND = {n: "actual" for n in ACTUAL_NAMES} | {n: "estimate" for n in ESTIMATE_NAMES}
+TITLE_TRANS = str.maketrans({c: "_" for c in r'\/?*[]:'})  # символы, запрещённые в именах листов
+
+# --- GraphQL-запросы ---
+proj_query = '''
+query($org:String!,$first:Int!,$after:String){
+  organization(login:$org){
+    projectsV2(first:$first,after:$after,orderBy:{field:UPDATED_AT,direction:DESC}){
+      pageInfo{hasNextPage,endCursor}
+      nodes{number,title,updatedAt,items{totalCount}}
+    }
+  }
+}'''
+search_query = '''
+query($q:String!,$first:Int!,$after:String){
+  search(query:$q,type:ISSUE,first:$first,after:$after){
+    issueCount
+    pageInfo{hasNextPage,endCursor}
+    nodes{...on Issue{
+      number,title,
+      repository{name},
+      assignees(first:10){nodes{login}},
+      url,createdAt,
+      projectItems(first:10){nodes{
+        project{number,title,updatedAt,owner{...on Organization{login}}}
+        fieldValues(first:20){nodes{
+          ...on ProjectV2ItemFieldNumberValue{
+            field{...on ProjectV2FieldCommon{name}},number
+          }
+        }}
+      }}
+    }}
+  }
+}'''
+SEARCH_LIMIT = 1000  # больше search не отдаёт ни при какой пагинации
+SEARCH_MIN_ITEMS = 5 * PAGE_SIZE  # с какого размера проекта задачи окна дат отбирать через search
+ITEMS_BATCH_SIZE = 8  # сколько проектов запрашивать одним GraphQL-документом
+# выборка страницы задач — один фрагмент на весь документ, алиасы только ссылаются на него
+items_fragment = '''
+fragment ItemsPage on ProjectV2ItemConnection{
+  pageInfo{hasNextPage,endCursor}
+  nodes{
+    content{...on Issue{
+      number,title,
+      repository{name},
+      assignees(first:10){nodes{login}},
+      url,createdAt
+    }}
+    fieldValues(first:20){nodes{
+      ...on ProjectV2ItemFieldNumberValue{
+        field{...on ProjectV2FieldCommon{name}},number
+      }
+    }}
+  }
+}'''
+
+@lru_cache(maxsize=None)
+def build_batched_items_query(count):
+    """Один запрос на count проектов: алиасы p0..pK, номер и курсор каждого — в $nI/$cI.
+
+    Текст зависит только от числа проектов, поэтому собирается один раз на каждое число.
+    """
+    params = "".join(f",$n{i}:Int!,$c{i}:String" for i in range(count))
+    blocks = "".join(
+        f"\n    p{i}:projectV2(number:$n{i}){{items(first:$first,after:$c{i}){{...ItemsPage}}}}"
+        for i in range(count)
+    )
+    return f"query($org:String!,$first:Int!{params}){{\n  organization(login:$org){{{blocks}\n  }}\n}}" + items_fragment
+
+def retry_delay(r, attempt):
+    """Пауза перед повтором запроса или None, если ответ не связан с перегрузкой/лимитами."""
+    if r.status_code in (502, 503, 504):
+        return 2 ** attempt
+    if r.status_code in (403, 429):
+        if "retry-after" in r.headers:
+            return float(r.headers["retry-after"])
+        if r.headers.get("x-ratelimit-remaining") == "0":
+            return max(float(r.headers.get("x-ratelimit-reset", 0)) - time.time(), 1)
+        if "secondary rate limit" in r.text.lower():
+            return 60 * 2 ** attempt
+    return None
+
+def errors_text(errors):
+    """Короткое описание ошибок GraphQL для лога."""
+    return "; ".join(e.get("message", "?") for e in errors[:3]) or "без описания"
+
+async def graphql_post(client, sem, query, variables, timeout=httpx.USE_CLIENT_DEFAULT):
+    """POST в GraphQL с повторами; возвращает (data, errors) — ошибки GitHub отдаёт рядом с data."""
+    body = orjson.dumps({"query": query, "variables": variables})
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with sem:
+                r = await client.post(GRAPHQL_URL, content=body, timeout=timeout)
+        except httpx.TransportError as e:
+            # таймауты и обрывы посреди ответа транспорт не повторяет — повторяем сами
+            if attempt == MAX_RETRIES:
+                raise
+            delay = 2 ** attempt
+            logger.warning(f"Запрос к GitHub не удался ({type(e).__name__}), повтор через {delay} с")
+            await asyncio.sleep(delay)
+            continue
+        delay = retry_delay(r, attempt) if attempt < MAX_RETRIES else None
+        if delay is None:
+            break
+        logger.warning(f"GitHub ответил {r.status_code}, повтор через {delay:.0f} с")
+        await asyncio.sleep(delay)
+    r.raise_for_status()
+    payload = orjson.loads(r.content)
+    return payload.get("data") or {}, payload.get("errors") or []
+
+async def graphql_pages(client, sem, query, variables, path, timeout=httpx.USE_CLIENT_DEFAULT):
+    """Отдаёт соединение по path (nodes, pageInfo, ...) постранично.
+
+    Следующая страница запрашивается, только когда её попросят.
+    """
+    vars_ = {**variables, "first": PAGE_SIZE, "after": None}
+    while True:
+        data, errors = await graphql_post(client, sem, query, vars_, timeout)
+        if errors:
+            logger.warning(f"GitHub вернул ошибки GraphQL: {errors_text(errors)}")
+        for part in path.split('.'):
+            data = data.get(part, {})
+        yield data
+        pi = data.get("pageInfo", {})
+        if not pi.get("hasNextPage"):
+            return
+        vars_["after"] = pi.get("endCursor")
+
+# --- Сбор проектов после start_date ---
+async def project_pages(client, sem, start_date):
+    """Постранично отдаёт проекты, обновлённые после start_date, пока список их ещё содержит."""
+    async for conn in graphql_pages(client, sem, proj_query, {"org": ORG}, "organization.projectsV2"):
+        nodes = conn.get("nodes", [])
+        updated = pd.to_datetime(
+            [p.get("updatedAt") for p in nodes], format="ISO8601", utc=True, errors="coerce"
+        ).tz_localize(None)
+        fresh = []
+        for p, dt in zip(nodes, updated):
+            if pd.isna(dt):
+                logger.warning(f"Invalid updatedAt в проекте #{p.get('number')}")
+            elif dt >= start_date:
+                fresh.append(p)
+        yield fresh
+        # проекты идут от свежих к старым: после первого устаревшего следующие страницы не нужны
+        if (updated < start_date).any():
+            return
+
+# --- Сбор задач из каждого проекта ---
+TASK_COLUMNS = ("project", "number", "title", "repo", "url", "createdAt", "assignees", "actual", "estimate")
+
+def item_rows(project_key, nodes, cols):
+    """Дописывает задачи страницы в cols — по списку на каждый столбец из TASK_COLUMNS."""
+    field_kind = FIELD_KIND.get
+    for it in nodes:
+        issue = it.get("content")
+        if not issue:
+            continue
+        actual = estimate = None
+        # идём с конца: побеждает последнее значение поля, как и раньше,
+        # зато как только найдены оба — остаток списка можно не смотреть
+        for fv in reversed(it.get("fieldValues",{}).get("nodes",[])):
+            if not (fld := fv.get("field")) or (val := fv.get("number")) is None:
+                continue
+            kind = field_kind(fld["name"].strip().lower())
+            if kind == "actual":
+                if actual is None: actual = val
+            elif kind == "estimate":
+                if estimate is None: estimate = val
+            else:
+                continue
+            if actual is not None and estimate is not None:
+                break
+        cols["project"].append(project_key)
+        cols["number"].append(issue["number"])
+        cols["title"].append(issue["title"])
+        cols["repo"].append(issue["repository"]["name"])
+        cols["url"].append(issue["url"])
+        cols["createdAt"].append(issue.get("createdAt"))
+        cols["assignees"].append([a["login"] for a in issue.get("assignees",{}).get("nodes",[])])
+        cols["actual"].append(0 if actual is None else actual)
+        cols["estimate"].append(0 if estimate is None else estimate)
+
+def tasks_frame(parts):
+    """Один DataFrame из колонок всех проектов (parts — словари TASK_COLUMNS -> список)."""
+    return pd.DataFrame({c: list(chain.from_iterable(part[c] for part in parts)) for c in TASK_COLUMNS})
+
+def filter_created(df, start_date, end_date):
+    """Разбирает createdAt одним векторным вызовом и оставляет задачи из [start_date, end_date]."""
+    if df.empty:
+        return df
+    created = pd.to_datetime(df["createdAt"], format="ISO8601", utc=True, errors="coerce").dt.tz_localize(None)
+    df = df.assign(createdAt=created)
+    return df[(created >= start_date) & (created <= end_date)]
+
+# --- Дисковый кэш страниц задач ---
+# Страница (проект, курсор) действительна, пока не изменился updatedAt проекта и не истёк CACHE_TTL.
+def open_cache(path):
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS item_pages ("
+        "project INTEGER, cursor TEXT, updated_at TEXT, fetched_at REAL, page BLOB,"
+        "PRIMARY KEY (project, cursor))"
+    )
+    db.execute("DELETE FROM item_pages WHERE fetched_at < ?", (time.time() - CACHE_TTL,))
+    return db
+
+def cache_get(db, num, cursor, updated_at):
+    row = db.execute(
+        "SELECT page FROM item_pages WHERE project = ? AND cursor = ? AND updated_at = ?",
+        (num, cursor or "", updated_at),
+    ).fetchone()
+    return orjson.loads(row[0]) if row else None
+
+def cache_put(db, num, cursor, updated_at, page):
+    db.execute(
+        "INSERT OR REPLACE INTO item_pages VALUES (?, ?, ?, ?, ?)",
+        (num, cursor or "", updated_at, time.time(), orjson.dumps(page)),
+    )
+
+def cache_has(db, num, updated_at):
+    """Есть ли в кэше первая страница проекта для его текущего updatedAt."""
+    return db.execute(
+        "SELECT 1 FROM item_pages WHERE project = ? AND cursor = '' AND updated_at = ?",
+        (num, updated_at),
+    ).fetchone() is not None
+
+def cache_prune(db, num, updated_at):
+    db.execute("DELETE FROM item_pages WHERE project = ? AND updated_at != ?", (num, updated_at))
+
+@lru_cache(maxsize=4096)
+def parse_dt(s):
+    """ISO-дата GitHub ('...Z') -> naive datetime; у задач из search updatedAt проектов повторяются."""
+    return datetime.fromisoformat(s.rstrip("Z"))
+
+def project_key(proj):
+    title_safe = proj.get("title","").translate(TITLE_TRANS)[:25]
+    return f"{proj['number']}_{title_safe}"
+
+async def fetch_chunk(client, sem, chunk, cache=None):
+    keys = {proj["number"]: project_key(proj) for proj in chunk}
+    updated = {proj["number"]: proj["updatedAt"] for proj in chunk}
+    if cache:
+        for num in keys:
+            cache_prune(cache, num, updated[num])
+    # номер проекта -> курсор следующей страницы; проект уходит, когда страницы кончились
+    pending = dict.fromkeys(keys)
+    base_vars = {"org": ORG, "first": PAGE_SIZE}
+    retries = {}  # номер проекта -> сколько раз подряд его алиас вернулся пустым
+    cols = {num: {c: [] for c in TASK_COLUMNS} for num in keys}
+
+    def consume(num, items):
+        item_rows(keys[num], items.get("nodes", []), cols[num])
+        pi = items.get("pageInfo",{})
+        if pi.get("hasNextPage"):
+            pending[num] = pi.get("endCursor")
+        else:
+            del pending[num]
+
+    while pending:
+        # страницы из кэша разбираем сразу, в запрос идут только промахи
+        nums = []
+        for num, cursor in list(pending.items()):
+            items = cache_get(cache, num, cursor, updated[num]) if cache else None
+            if items is None:
+                nums.append(num)
+            else:
+                consume(num, items)
+        if not nums:
+            continue
+        variables = base_vars.copy()
+        for i, num in enumerate(nums):
+            variables[f"n{i}"] = num
+            variables[f"c{i}"] = pending[num]
+        data, errors = await graphql_post(
+            client, sem, build_batched_items_query(len(nums)), variables, ITEMS_TIMEOUT
+        )
+        org = data.get("organization") or {}
+        # ошибки раскладываем по алиасам: path вида ["organization", "p3", ...]
+        alias_errors = {}
+        for e in errors:
+            path = e.get("path") or []
+            alias_errors.setdefault(path[1] if len(path) > 1 else None, []).append(e)
+        backoff = 0
+        for i, num in enumerate(nums):
+            alias = f"p{i}"
+            items = (org.get(alias) or {}).get("items")
+            errs = alias_errors.get(alias) or alias_errors.get(None) or []
+            if items is None:
+                # подзапрос проекта упал (таймаут, NOT_FOUND, FORBIDDEN): проект не пустой,
+                # страницу запрашиваем снова, а не пропускаем его задачи молча
+                retries[num] = retries.get(num, 0) + 1
+                if retries[num] > MAX_RETRIES:
+                    raise RuntimeError(f"Не удалось получить задачи проекта #{num}: {errors_text(errs)}")
+                logger.warning(f"Проект #{num}: GitHub не вернул страницу задач ({errors_text(errs)}), повтор")
+                backoff = max(backoff, retries[num])
+                continue
+            retries.pop(num, None)
+            if errs:
+                logger.warning(f"Проект #{num}: страница задач пришла с ошибками ({errors_text(errs)})")
+            # в кэш — только целые страницы: иначе неполный ответ прожил бы весь CACHE_TTL
+            if cache and not errs and "pageInfo" in items:
+                cache_put(cache, num, pending[num], updated[num], items)
+            consume(num, items)
+        if backoff:
+            await asyncio.sleep(2 ** (backoff - 1))
+    return cols
+
+async def fetch_projects(client, sem, projects, cache=None):
+    """Обходит задачи проектов батчами по ITEMS_BATCH_SIZE; возвращает {номер: cols}."""
+    # курсоры непрозрачны, поэтому страницы одного проекта идут только последовательно.
+    # Проекты со схожим числом страниц кладём в один батч (крупные — первыми):
+    # их цепочки кончаются вместе, без почти пустых запросов.
+    queue = sorted(projects, key=lambda p: p["items"]["totalCount"], reverse=True)
+    chunks = [queue[i:i + ITEMS_BATCH_SIZE] for i in range(0, len(queue), ITEMS_BATCH_SIZE)]
+    fetched = {}
+    for cols in await asyncio.gather(*(fetch_chunk(client, sem, c, cache) for c in chunks)):
+        fetched.update(cols)
+    return fetched
+
+# --- Отбор задач через search ---
+async def search_issues(client, sem, q):
+    """Задачи по запросу search или None, если их не меньше SEARCH_LIMIT (выдача была бы неполной).
+
+    issueCount приходит с первой страницей: при переполнении остальные страницы не качаем.
+    """
+    issues = []
+    async for conn in graphql_pages(client, sem, search_query, {"q": q}, "search", ITEMS_TIMEOUT):
+        if conn.get("issueCount", 0) >= SEARCH_LIMIT:
+            return None
+        issues.extend(conn.get("nodes", []))
+    return issues
+
+def search_cols(issues, keep):
+    """Раскладывает задачи из search по проектам организации: {номер: cols}.
+
+    keep(project) решает, нужен ли проект из projectItems задачи.
+    """
+    keys, cols = {}, {}
+    for issue in issues:
+        for pi in issue.get("projectItems",{}).get("nodes",[]):
+            proj = pi.get("project") or {}
+            if (proj.get("owner") or {}).get("login") != ORG or not keep(proj):
+                continue
+            num = proj["number"]
+            if num not in keys:
+                keys[num] = project_key(proj)
+                cols[num] = {c: [] for c in TASK_COLUMNS}
+            item_rows(keys[num], [{"content": issue, "fieldValues": pi.get("fieldValues",{})}], cols[num])
+    return cols
+
+async def fetch_via_search(client, sem, assignee, start_date, end_date):
+    """GitHub сам отбирает задачи по assignee и дате создания; обходить все проекты не нужно.
+
+    None, если search упёрся в SEARCH_LIMIT: выдача неполная, нужен обход проектов.
+    """
+    q = f"assignee:{assignee} is:issue created:{start_date.date()}..{end_date.date()} sort:created-asc"
+    issues = await search_issues(client, sem, q)
+    if issues is None:
+        return None
+    cols = search_cols(issues, lambda p: parse_dt(p["updatedAt"]) >= start_date)
+    return [cols[num] for num in sorted(cols)]
+
+async def fetch_project_search(client, sem, proj, start_date, end_date):
+    """Задачи одного проекта, созданные в окне дат, — через search вместо обхода всей истории.
+
+    None, если search упёрся в SEARCH_LIMIT: тогда проект нужно обойти целиком.
+    """
+    num = proj["number"]
+    q = f"project:{ORG}/{num} is:issue created:{start_date.date()}..{end_date.date()} sort:created-asc"
+    issues = await search_issues(client, sem, q)
+    if issues is None:
+        return None
+    cols = search_cols(issues, lambda p: p["number"] == num)
+    return cols.get(num) or {c: [] for c in TASK_COLUMNS}
+
+async def fetch_window(client, sem, projects, start_date, end_date, cache=None):
+    """Задачи проектов за окно дат: большие — через search, остальные обходом; {номер: cols}."""
+    # пустые проекты не запрашиваем. В больших окно дат обычно покрывает малую часть
+    # истории — их задачи отбирает search по created:, если страниц нет в кэше.
+    # Мелкие дешевле обойти целиком: батч из нескольких проектов стоит один запрос
+    nonempty = [p for p in projects if p["items"]["totalCount"]]
+    large = [
+        p for p in nonempty
+        if p["items"]["totalCount"] >= SEARCH_MIN_ITEMS
+        and not (cache and cache_has(cache, p["number"], p["updatedAt"]))
+    ]
+    searched, fetched = await asyncio.gather(
+        asyncio.gather(*(fetch_project_search(client, sem, p, start_date, end_date) for p in large)),
+        fetch_projects(client, sem, [p for p in nonempty if p not in large], cache),
+    )
+    overflow = []
+    for proj, cols in zip(large, searched):
+        if cols is None:
+            overflow.append(proj)
+        else:
+            fetched[proj["number"]] = cols
+    if overflow:
+        fetched.update(await fetch_projects(client, sem, overflow, cache))
+    return fetched
+
+# --- Параллельный сбор всех задач через один HTTP/2-пул ---
+async def walk_projects(client, sem, start_date, end_date, cache=None):
+    """Задачи всех проектов, обновлённых после start_date: список cols по номерам проектов или None."""
+    # задачи проектов страницы качаем сразу, не дожидаясь остальных страниц списка.
+    # У списка свой семафор на один запрос: в очереди за трафиком задач он не стоит
+    list_sem = asyncio.Semaphore(1)
+    projects, pending, seen = [], [], set()
+    async for page in project_pages(client, list_sem, start_date):
+        # порядок UPDATED_AT меняется на ходу: проект, обновлённый во время обхода,
+        # может прийти ещё раз на следующей странице — второй раз его не берём
+        page = [p for p in page if p["number"] not in seen]
+        seen.update(p["number"] for p in page)
+        projects.extend(page)
+        pending.append(asyncio.create_task(
+            fetch_window(client, sem, page, start_date, end_date, cache)
+        ))
+    fetched = {}
+    for cols in await asyncio.gather(*pending):
+        fetched.update(cols)
+    if not projects:
+        return None
+    logger.info(f"Найдено {len(projects)} проектов после {start_date.date()}")
+    projects.sort(key=lambda p: p["number"])
+    return [fetched[p["number"]] for p in projects if p["number"] in fetched]
+
+async def collect_tasks(headers, start_date, end_date, assignee=None, cache=None):
+    # один пул keep-alive соединений на весь прогон; обрывы соединения транспорт повторяет сам
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=MAX_RETRIES,
+        # +1 — под список проектов, у которого свой семафор
+        limits=httpx.Limits(max_connections=MAX_CONCURRENCY + 1, max_keepalive_connections=MAX_CONCURRENCY + 1),
+    )
+    async with httpx.AsyncClient(transport=transport, headers=headers, timeout=TIMEOUT) as client:
+        sem = asyncio.Semaphore(MAX_CONCURRENCY)
+        parts = None
+        if assignee:
+            parts = await fetch_via_search(client, sem, assignee, start_date, end_date)
+            if parts is None:
+                # усечённый отчёт хуже медленного: обходим проекты, assignee отберёт script.py
+                logger.warning(f"search по {assignee} упёрся в лимит {SEARCH_LIMIT} задач — обходим все проекты")
+        if parts is None:
+            parts = await walk_projects(client, sem, start_date, end_date, cache)
+            if parts is None:
+                return None
+    return filter_created(tasks_frame(parts), start_date, end_date)
+
+def fetch_tasks(token, start_date, end_date, assignee=None, use_cache=False):
+    """Задачи из проектов ORG, созданные в [start_date, end_date], одним DataFrame.
+
+    С assignee — только его задачи (через search; если search упёрся в SEARCH_LIMIT —
+    задачи всех проектов, отбор по assignee остаётся вызывающему). None, если нет проектов,
+    обновлённых после start_date. use_cache=True — брать страницы задач из CACHE_PATH.
+    """
+    # тело запроса сериализует orjson, поэтому Content-Type задаём сами
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    cache = None
+    if use_cache:
+        cache = open_cache(CACHE_PATH)
+        logger.warning(
+            f"Кэш страниц включён: правки задач (assignees, title) могут попасть в отчёт "
+            f"с опозданием до {CACHE_TTL // 60} мин"
+        )
+    try:
+        return asyncio.run(collect_tasks(headers, start_date, end_date, assignee, cache))
+    finally:
+        if cache:
+            cache.commit()
+            cache.close()
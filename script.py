@@ -1,16 +1,18 @@
 #!/usr/bin/env python3
 import os
 import sys
-import re
 import logging
-import requests
-import pandas as pd
+import numpy as np
+import xlsxwriter
+from xlsxwriter.utility import xl_col_to_name
 import argparse
-import tempfile
+import io
 import zipfile
 from dotenv import load_dotenv
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from gh_projects import fetch_tasks
 
 # --- Логирование ---
 logging.basicConfig(
@@ -20,273 +22,196 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# --- CLI аргументы ---
-parser = argparse.ArgumentParser(
-    description="Генерация zip-архива отчётов по GitHub Projects для одного/всех assignee"
-)
-parser.add_argument("-a", "--assignee", help="GitHub-логин assignee")
-parser.add_argument("-s", "--start",    required=True, help="Дата начала YYYY-MM-DD")
-parser.add_argument("-e", "--end",      required=True, help="Дата окончания YYYY-MM-DD")
-parser.add_argument("-o", "--output",   help="Имя выходного ZIP-файла (по умолчанию reports_<start>_<end>.zip)")
-args = parser.parse_args()
-
-# --- Валидация дат ---
-try:
-    start_date = datetime.fromisoformat(args.start)
-    end_date   = datetime.fromisoformat(args.end)
-except ValueError:
-    parser.error("Даты должны быть в формате YYYY-MM-DD")
-
-# --- Имя выходного архива ---
-output_name = args.output or f"reports_{start_date.date()}_{end_date.date()}.zip"
-
-# --- Загрузка GitHub токена ---
-load_dotenv()
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
-if not GITHUB_TOKEN:
-    logger.error("Не найден GITHUB_TOKEN в окружении.")
-    sys.exit(1)
-headers = {"Authorization": f"Bearer {GITHUB_TOKEN}"}
-
-# --- Настройки проекта ---
-ORG = "Maxinum"
-PAGE_SIZE = 100
-ACTUAL_NAMES   = {"actual","actual hours","acutal hours"}
-ESTIMATE_NAMES = {"estimate","planned hours","hours","estimate hours","estimates"}
-
-# --- GraphQL-запросы ---
-proj_query = '''
-query($org:String!,$first:Int!,$after:String){
-  organization(login:$org){
-    projectsV2(first:$first,after:$after){
-      pageInfo{hasNextPage,endCursor}
-      nodes{number,title,updatedAt}
-    }
-  }
-}'''
-items_query = '''
-query($org:String!,$projNum:Int!,$first:Int!,$after:String){
-  organization(login:$org){
-    projectV2(number:$projNum){
-      items(first:$first,after:$after){
-        pageInfo{hasNextPage,endCursor}
-        nodes{
-          content{...on Issue{
-            number,title,
-            repository{name},
-            assignees(first:10){nodes{login}},
-            url,createdAt
-          }}
-          fieldValues(first:20){nodes{
-            ...on ProjectV2ItemFieldNumberValue{
-              field{...on ProjectV2FieldCommon{name}},number
-            }
-          }}
-        }
-      }
-    }
-  }
-}'''
-
-def graphql_paginate(query, variables, path):
-    items, cursor = [], None
-    while True:
-        vars_ = {**variables, "first": PAGE_SIZE, "after": cursor}
-        r = requests.post(
-            "https://api.github.com/graphql",
-            json={"query": query, "variables": vars_},
-            headers=headers, timeout=10
+# --- Генерация Excel + диаграммы ---
+# constant_memory: xlsxwriter сбрасывает каждую строку на диск сразу после записи,
+# поэтому данные пишем строго сверху вниз (to_excel в pandas пишет по столбцам).
+XLSX_OPTIONS = {
+    "constant_memory": True,
+    "use_zip64": True,
+    "default_date_format": "yyyy-mm-dd hh:mm:ss",
+}
+
+# xlsxwriter упаковывает xlsx с zlib level 6 и не даёт это настроить; level 1 заметно быстрее
+# при чуть большем размере файла. Workbook берёт ZipFile из своего модуля в момент close().
+XLSX_COMPRESSLEVEL = 1
+
+class FastZipFile(zipfile.ZipFile):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("compresslevel", XLSX_COMPRESSLEVEL)
+        super().__init__(*args, **kwargs)
+
+xlsxwriter.workbook.ZipFile = FastZipFile
+
+def write_rows(ws, columns, rows, header_fmt):
+    ws.write_row(0, 0, columns, header_fmt)
+    for r, row in enumerate(rows, start=1):
+        ws.write_row(r, 0, row)
+
+CHART_OPTIONS  = {"type": "column"}
+CHART_LEGEND   = {"position": "bottom"}
+CHART_INSERT   = {"x_scale": 1.5, "y_scale": 1.5}
+
+def add_hours_chart(workbook, ws, sheet, cols, nrows, title, totals):
+    """Под nrows строками данных: строка estimate/actual с формулами SUM и столбчатая диаграмма.
+
+    totals — уже посчитанные суммы (Series с estimate/actual), пишутся как кэш формул.
+    """
+    if "estimate" not in cols or "actual" not in cols:
+        return
+    label_row = nrows + 1    # 0-based: сразу под данными
+    data_row  = nrows + 2
+    i_est     = cols.index("estimate")
+    i_act     = cols.index("actual")
+
+    # пишем заголовки и суммы; кэш нужен программам, которые не пересчитывают формулы
+    ws.write(label_row, i_est, "estimate")
+    ws.write(label_row, i_act, "actual")
+    for i, name in ((i_est, "estimate"), (i_act, "actual")):
+        col = xl_col_to_name(i)
+        ws.write_formula(data_row, i, f"=SUM({col}2:{col}{nrows + 1})", None, totals[name].item())
+
+    # строим график
+    chart = workbook.add_chart(CHART_OPTIONS)
+    for name, i in (("Estimate", i_est), ("Actual", i_act)):
+        chart.add_series({
+            "name":       name,
+            "categories": [sheet, label_row, i_est, label_row, i_act],
+            "values":     [sheet, data_row, i, data_row, i],
+        })
+    chart.set_title({"name": title})
+    chart.set_legend(CHART_LEGEND)
+    ws.insert_chart(data_row + 2, 0, chart, CHART_INSERT)
+
+def build_report(user, df_user, sheet_rows, start_date, end_date):
+    """Собирает xlsx-отчёт одного assignee; возвращает (имя файла, содержимое).
+
+    sheet_rows: проект -> позиции его строк в df_user.
+    """
+    df_user = df_user.assign(assignees=df_user["assignees"].str.join(", "))
+
+    fname = f"GitHub_Report_{user}_{start_date.date()}_{end_date.date()}.xlsx"
+    buf = io.BytesIO()
+    logger.info(f"Создаём {fname} ...")
+
+    # все суммы часов — одним groupby, а не по .sum() на каждый лист
+    sums = df_user.groupby("project", sort=False, observed=True)[["estimate", "actual"]].sum()
+
+    # в Python-значения переводим весь отчёт разом; листы проектов — срезы тех же строк
+    cols = list(df_user.columns)
+    rows = df_user.to_numpy(dtype=object).tolist()
+    i_proj = cols.index("project")
+    sheet_cols = cols[:i_proj] + cols[i_proj + 1:]
+    sheet_data = [row[:i_proj] + row[i_proj + 1:] for row in rows]
+
+    # используем xlsxwriter, чтобы рисовать графики
+    with xlsxwriter.Workbook(buf, XLSX_OPTIONS) as workbook:
+        header_fmt = workbook.add_format(
+            {"bold": True, "border": 1, "align": "center", "valign": "top"}
         )
-        r.raise_for_status()
-        data = r.json().get("data", {})
-        for part in path.split('.'):
-            data = data.get(part, {})
-        nodes = data.get("nodes", [])
-        items.extend(nodes)
-        pi = data.get("pageInfo", {})
-        if not pi.get("hasNextPage"):
-            break
-        cursor = pi.get("endCursor")
-    return items
-
-# --- Сбор проектов после start_date ---
-all_projects = graphql_paginate(proj_query, {"org": ORG}, "organization.projectsV2")
-projects = []
-for p in all_projects:
+
+        # 1) Листы по проектам
+        for proj in sorted(sheet_rows):
+            grp = [sheet_data[i] for i in sheet_rows[proj]]
+            sheet = proj[:31]  # имя листа ≤31 символ
+            ws = workbook.add_worksheet(sheet)
+            write_rows(ws, sheet_cols, grp, header_fmt)
+            add_hours_chart(workbook, ws, sheet, sheet_cols, len(grp), "Сумма часов", sums.loc[proj])
+
+        # 2) Summary-лист
+        ws_sum = workbook.add_worksheet("Summary")
+        write_rows(ws_sum, cols, rows, header_fmt)
+        add_hours_chart(workbook, ws_sum, "Summary", cols, len(rows), "Сумма часов (Summary)", sums.sum())
+
+    return fname, buf.getvalue()
+
+def main():
+    # --- CLI аргументы ---
+    parser = argparse.ArgumentParser(
+        description="Генерация zip-архива отчётов по GitHub Projects для одного/всех assignee"
+    )
+    parser.add_argument("-a", "--assignee", help="GitHub-логин assignee")
+    parser.add_argument("-s", "--start",    required=True, help="Дата начала YYYY-MM-DD")
+    parser.add_argument("-e", "--end",      required=True, help="Дата окончания YYYY-MM-DD")
+    parser.add_argument("-o", "--output",   help="Имя выходного ZIP-файла (по умолчанию reports_<start>_<end>.zip)")
+    parser.add_argument("--cache", action="store_true", help="Брать страницы задач из дискового кэша (до часа)")
+    args = parser.parse_args()
+
+    # --- Валидация дат ---
     try:
-        dt = datetime.fromisoformat(p["updatedAt"].rstrip("Z"))
-        if dt >= start_date:
-            projects.append(p)
-    except Exception:
-        logger.warning(f"Invalid updatedAt в проекте #{p.get('number')}")
-if not projects:
-    logger.info(f"Нет проектов после {start_date.date()}. Выход.")
-    sys.exit(0)
-logger.info(f"Найдено {len(projects)} проектов после {start_date.date()}")
-
-# --- Сбор задач из каждого проекта ---
-def fetch_proj_all(proj):
-    num = proj["number"]
-    title_safe = re.sub(r"[\\\/\?\*\[\]:]", "_", proj.get("title",""))[:25]
-    rows, cursor = [], None
-    while True:
-        r = requests.post(
-            "https://api.github.com/graphql",
-            json={
-                "query": items_query,
-                "variables": {"org": ORG, "projNum": num, "first": PAGE_SIZE, "after": cursor}
-            },
-            headers=headers, timeout=10
-        )
-        r.raise_for_status()
-        items = (r.json().get("data",{})
-                    .get("organization",{})
-                    .get("projectV2",{})
-                    .get("items",{}))
-        for it in items.get("nodes", []):
-            issue = it.get("content")
-            if not issue:
-                continue
-            try:
-                created = datetime.fromisoformat(issue["createdAt"].rstrip("Z"))
-            except Exception:
-                continue
-            if not (start_date <= created <= end_date):
-                continue
-            assignees = [a["login"] for a in issue.get("assignees",{}).get("nodes",[])]
-            actual = estimate = 0
-            for fv in it.get("fieldValues",{}).get("nodes",[]):
-                fld, val = fv.get("field"), fv.get("number")
-                if fld and val is not None:
-                    nm = fld["name"].strip().lower()
-                    if nm in ACTUAL_NAMES: actual = val
-                    if nm in ESTIMATE_NAMES: estimate = val
-            rows.append({
-                "project":   f"{num}_{title_safe}",
-                "number":    issue["number"],
-                "title":     issue["title"],
-                "repo":      issue["repository"]["name"],
-                "url":       issue["url"],
-                "createdAt": created,
-                "assignees": assignees,
-                "actual":    actual,
-                "estimate":  estimate
-            })
-        pi = items.get("pageInfo",{})
-        if not pi.get("hasNextPage"):
-            break
-        cursor = pi.get("endCursor")
-    return pd.DataFrame(rows)
-
-# --- Параллельный сбор всех задач ---
-with ThreadPoolExecutor(max_workers=4) as executor:
-    dfs = list(executor.map(fetch_proj_all, projects))
-all_tasks = pd.concat(dfs, ignore_index=True)
-
-# --- Определяем assignees ---
-users = [args.assignee] if args.assignee else sorted(
-    {u for lst in all_tasks["assignees"] for u in lst}
-)
-if not users:
-    logger.info("Нет assignee для отчёта. Выход.")
-    sys.exit(0)
+        start_date = datetime.fromisoformat(args.start)
+        end_date   = datetime.fromisoformat(args.end)
+    except ValueError:
+        parser.error("Даты должны быть в формате YYYY-MM-DD")
+
+    # --- Имя выходного архива ---
+    output_name = args.output or f"reports_{start_date.date()}_{end_date.date()}.zip"
+
+    # --- Загрузка GitHub токена ---
+    load_dotenv()
+    token = os.getenv("GITHUB_TOKEN")
+    if not token:
+        logger.error("Не найден GITHUB_TOKEN в окружении.")
+        sys.exit(1)
 
-# --- Генерация Excel + диаграммы и упаковка в ZIP ---
-with tempfile.TemporaryDirectory() as tmpdir:
-    generated = []
+    # --- Сбор задач ---
+    all_tasks = fetch_tasks(token, start_date, end_date, args.assignee, use_cache=args.cache)
+    if all_tasks is None:
+        logger.info(f"Нет проектов после {start_date.date()}. Выход.")
+        sys.exit(0)
+
+    # --- Разбиваем задачи по assignee и проектам за один проход ---
+    # низкокардинальные строковые ключи держим как category: группировка идёт по целочисленным кодам
+    all_tasks = all_tasks.astype({"project": "category", "repo": "category"})
+    # разворачиваем только столбец assignees: индекс развёрнутой серии — позиция задачи в all_tasks,
+    # так что фрейм пользователя — это take() по позициям, без копии всей таблицы на каждого
+    assignee = all_tasks["assignees"].reset_index(drop=True).explode().astype("category")
+    task_pos = assignee.index.to_numpy()
+    project = all_tasks["project"].array.take(task_pos)
+    user_rows = {
+        user: task_pos[idx]
+        for user, idx in assignee.groupby(assignee, sort=False, observed=True).indices.items()
+    }
+    sheet_rows = {}
+    by_user_proj = assignee.groupby([assignee.array, project], sort=False, observed=True).indices
+    for (user, proj), idx in by_user_proj.items():
+        # позиции строк проекта внутри фрейма пользователя
+        sheet_rows.setdefault(user, {})[proj] = np.searchsorted(user_rows[user], task_pos[idx])
+    users = [args.assignee] if args.assignee else sorted(user_rows)
+    if not users:
+        logger.info("Нет assignee для отчёта. Выход.")
+        sys.exit(0)
+
+    # --- Генерация Excel в отдельных процессах и упаковка в ZIP ---
+    jobs = []
     for user in users:
-        df_user = all_tasks[all_tasks["assignees"].apply(lambda lst: user in lst)]
-        if df_user.empty:
+        if user not in user_rows:
             logger.info(f"Нет задач для {user}, пропускаем")
             continue
+        df_user = all_tasks.take(user_rows[user])
+        jobs.append((user, df_user, sheet_rows[user]))
 
-        fname = f"GitHub_Report_{user}_{start_date.date()}_{end_date.date()}.xlsx"
-        fpath = os.path.join(tmpdir, fname)
-        logger.info(f"Создаём {fname} ...")
-
-        # используем xlsxwriter, чтобы рисовать графики
-        with pd.ExcelWriter(fpath, engine="xlsxwriter") as writer:
-            workbook  = writer.book
-
-            # 1) Листы по проектам
-            for proj, grp in df_user.groupby("project"):
-                grp2 = grp.drop(columns=["project"], errors="ignore")
-                sheet = proj[:31]  # имя листа ≤31 символ
-                grp2.to_excel(writer, sheet_name=sheet, index=False)
-                ws = writer.sheets[sheet]
-
-                # вычисляем строки/столбцы для summary
-                nrows     = len(grp2)
-                label_row = nrows + 1    # 0-based: сразу под данными
-                data_row  = nrows + 2
-                cols      = list(grp2.columns)
-                if "estimate" in cols and "actual" in cols:
-                    i_est = cols.index("estimate")
-                    i_act = cols.index("actual")
-
-                    # пишем заголовки и суммы
-                    ws.write(label_row, i_est, "estimate")
-                    ws.write(label_row, i_act, "actual")
-                    ws.write(data_row,  i_est, grp2["estimate"].sum())
-                    ws.write(data_row,  i_act, grp2["actual"].sum())
-
-                    # строим график
-                    chart = workbook.add_chart({"type": "column"})
-                    chart.add_series({
-                        "name":       "Estimate",
-                        "categories": [sheet, label_row, i_est, label_row, i_act],
-                        "values":     [sheet, data_row, i_est,   data_row, i_est],
-                    })
-                    chart.add_series({
-                        "name":       "Actual",
-                        "categories": [sheet, label_row, i_est, label_row, i_act],
-                        "values":     [sheet, data_row, i_act,   data_row, i_act],
-                    })
-                    chart.set_title({"name": "Сумма часов"})
-                    chart.set_legend({"position": "bottom"})
-                    ws.insert_chart(data_row + 2, 0, chart, {"x_scale": 1.5, "y_scale": 1.5})
-
-            # 2) Summary-лист
-            df_user.to_excel(writer, sheet_name="Summary", index=False)
-            ws_sum = writer.sheets["Summary"]
-            nrows  = len(df_user)
-            lbl_r  = nrows + 1
-            dat_r  = nrows + 2
-            cols   = list(df_user.columns)
-            if "estimate" in cols and "actual" in cols:
-                ie = cols.index("estimate")
-                ia = cols.index("actual")
-                ws_sum.write(lbl_r, ie, "estimate")
-                ws_sum.write(lbl_r, ia, "actual")
-                ws_sum.write(dat_r, ie, df_user["estimate"].sum())
-                ws_sum.write(dat_r, ia, df_user["actual"].sum())
-
-                chart = workbook.add_chart({"type": "column"})
-                chart.add_series({
-                    "name":       "Estimate",
-                    "categories": ["Summary", lbl_r, ie, lbl_r, ia],
-                    "values":     ["Summary", dat_r, ie, dat_r, ie],
-                })
-                chart.add_series({
-                    "name":       "Actual",
-                    "categories": ["Summary", lbl_r, ie, lbl_r, ia],
-                    "values":     ["Summary", dat_r, ia, dat_r, ia],
-                })
-                chart.set_title({"name": "Сумма часов (Summary)"})
-                chart.set_legend({"position": "bottom"})
-                ws_sum.insert_chart(dat_r + 2, 0, chart, {"x_scale": 1.5, "y_scale": 1.5})
-
-        generated.append((fpath, fname))
-
-    if not generated:
+    if not jobs:
         logger.error("Ни одного отчёта не было сгенерировано. Выход.")
         sys.exit(1)
 
-    # пакуем всё в ZIP
+    if len(jobs) == 1:
+        generated = [build_report(*jobs[0], start_date, end_date)]
+    else:
+        # xlsxwriter — чистый Python под GIL, поэтому отчёты распределяем по процессам
+        job_users, job_frames, job_sheets = zip(*jobs)
+        with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+            generated = list(pool.map(
+                build_report, job_users, job_frames, job_sheets, repeat(start_date), repeat(end_date)
+            ))
+
+    # пакуем всё в ZIP без сжатия: xlsx уже сжат внутри, повторный deflate почти ничего не даёт
     zip_path = os.path.abspath(output_name)
-    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for full, arc in generated:
-            zf.write(full, arcname=arc)
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for arc, data in generated:
+            zf.writestr(arc, data)
     logger.info(f"ZIP-архив готов: {zip_path}")
 
-print(f"✅ Готово! Ваш архив: {zip_path}")
+    print(f"✅ Готово! Ваш архив: {zip_path}")
+
+if __name__ == "__main__":
+    main()